@@ -151,8 +151,9 @@ class Plugin:
     ) -> Plugin:
         plugin = Plugin.__new__(cls)
         super(Plugin, plugin).__init__()
-        plugin._tree = ast.parse(source)
         plugin.filename = str(filename) if filename else None
+        # pass on the filename so it's included in any SyntaxError
+        plugin._tree = ast.parse(source, filename=plugin.filename or "<unknown>")
         plugin.module = cst_parse_module_native(source)
         return plugin
 
@@ -21,7 +21,7 @@ from .visitors import (
 from .visitors.visitor_utility import NoqaHandler
 
 if TYPE_CHECKING:
-    from collections.abc import Iterable, Mapping
+    from collections.abc import Callable, Iterable, Mapping
 
     from libcst import Module
 
@@ -29,6 +29,24 @@ if TYPE_CHECKING:
     from .visitors.flake8asyncvisitor import Flake8AsyncVisitor, Flake8AsyncVisitor_cst
 
 
+# Node types that never have any child nodes. If no visitor handles them there is
+# nothing to do when visiting them, so the runner skips them entirely.
+LEAF_NODE_TYPES = (
+    ast.expr_context,
+    ast.boolop,
+    ast.operator,
+    ast.unaryop,
+    ast.cmpop,
+    ast.Constant,
+    ast.alias,
+    ast.Pass,
+    ast.Break,
+    ast.Continue,
+    ast.Global,
+    ast.Nonlocal,
+)
+
+
 @dataclass
 class SharedState:
     options: Options
@@ -62,6 +80,18 @@ class Flake8AsyncRunner(ast.NodeVisitor, __CommonRunner):
         self.visitors = {
             v(self.state) for v in ERROR_CLASSES if self.selected(v.error_codes)
         }
+        self.all_visitors = (*self.utility_visitors, *self.visitors)
+
+        # visitors that are currently iterating through the subfields of a node
+        # themselves, and should not be called for any nodes below it.
+        self.suspended: set[Flake8AsyncVisitor] = set()
+
+        # registry of the visitor methods for each node type, filled in as node types
+        # are encountered, so each node only dispatches to the visitors that handle it.
+        self.handlers: dict[
+            type[ast.AST],
+            tuple[tuple[Flake8AsyncVisitor, Callable[[ast.AST], None]], ...],
+        ] = {}
 
     @classmethod
     def run(cls, tree: ast.AST, options: Options) -> Iterable[Error]:
@@ -69,18 +99,33 @@ class Flake8AsyncRunner(ast.NodeVisitor, __CommonRunner):
         runner.visit(tree)
         yield from runner.state.problems
 
+    def get_handlers(
+        self, node_type: type[ast.AST]
+    ) -> tuple[tuple[Flake8AsyncVisitor, Callable[[ast.AST], None]], ...]:
+        """Get all visitors, and their method, that have a visitor for `node_type`."""
+        handlers = self.handlers.get(node_type)
+        if handlers is None:
+            method = "visit_" + node_type.__name__
+            handlers = self.handlers[node_type] = tuple(
+                (subclass, class_method)
+                for subclass in self.all_visitors
+                # check if subclass has defined a visitor for this type, ignoring
+                # methods inherited from ast.NodeVisitor such as the deprecated
+                # `visit_Constant` shim, which only dispatches to `visit_Num` & co.
+                if (class_method := getattr(subclass, method, None)) is not None
+                and getattr(type(subclass), method)
+                is not getattr(ast.NodeVisitor, method, None)
+            )
+        return handlers
+
     def visit(self, node: ast.AST):
         """Visit a node."""
         # tracks the subclasses that, from this node on, iterated through it's subfields
         # we need to remember it so we can restore it at the end of the function.
         novisit: set[Flake8AsyncVisitor] = set()
 
-        method = "visit_" + node.__class__.__name__
-
-        for subclass in *self.utility_visitors, *self.visitors:
-            # check if subclass has defined a visitor for this type
-            class_method = getattr(subclass, method, None)
-            if class_method is None:
+        for subclass, class_method in self.get_handlers(type(node)):
+            if subclass in self.suspended:
                 continue
 
             # call it
@@ -91,9 +136,9 @@ class Flake8AsyncRunner(ast.NodeVisitor, __CommonRunner):
             if subclass.novisit:
                 novisit.add(subclass)
 
-        # Remove all subclasses that iterated through subfields from our list of
-        # visitors, so we don't visit them twice.
-        self.visitors.difference_update(novisit)
+        # Suspend all subclasses that iterated through subfields, so we don't visit
+        # them twice.
+        self.suspended.update(novisit)
 
         # iterate through subfields using NodeVisitor
         self.generic_visit(node)
@@ -102,12 +147,27 @@ class Flake8AsyncRunner(ast.NodeVisitor, __CommonRunner):
         for subclass in novisit:
             subclass.novisit = False
 
-        # and add them back to our visitors
-        self.visitors.update(novisit)
+        # and resume them
+        self.suspended.difference_update(novisit)
 
         # restore any outer state that was saved in the visitor method
-        for subclass in *self.utility_visitors, *self.visitors:
-            subclass.set_state(subclass.outer.pop(node, {}))
+        # (most visitors have nothing saved, so check that before anything else)
+        for subclass in self.all_visitors:
+            if (
+                subclass.outer
+                and subclass not in self.suspended
+                and (state := subclass.outer.pop(node, None)) is not None
+            ):
+                subclass.set_state(state)
+
+    def generic_visit(self, node: ast.AST):
+        """Visit all child nodes, except leaf nodes without any visitors."""
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, LEAF_NODE_TYPES) and not self.get_handlers(
+                type(child)
+            ):
+                continue
+            self.visit(child)
 
 
 class Flake8AsyncRunner_cst(__CommonRunner):
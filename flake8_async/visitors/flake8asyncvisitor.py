@@ -12,7 +12,7 @@ from libcst.metadata import PositionProvider
 from ..base import Error, Statement, strip_error_subidentifier
 
 if TYPE_CHECKING:
-    from collections.abc import Iterable, Mapping
+    from collections.abc import Callable, Iterable, Mapping
 
     from ..runner import SharedState
 
@@ -34,6 +34,9 @@ class Flake8AsyncVisitor(ast.NodeVisitor, ABC):
         self.options = self.__state.options
         self.typed_calls = self.__state.typed_calls
 
+        # visitor method (or None) for each node type, looked up on first encounter
+        self.visit_methods: dict[type[ast.AST], Callable[[Any], Any] | None] = {}
+
         # mark variables that shouldn't be saved/loaded in self.get_state
         self.nocopy = {
             "_Flake8AsyncVisitor__state",
@@ -43,6 +46,7 @@ class Flake8AsyncVisitor(ast.NodeVisitor, ABC):
             "options",
             "outer",
             "typed_calls",
+            "visit_methods",
         }
 
     # `variables` can be saved/loaded, but need a setter to not clear the reference
@@ -57,8 +61,13 @@ class Flake8AsyncVisitor(ast.NodeVisitor, ABC):
 
     def visit(self, node: ast.AST):
         """Visit a node."""
-        # construct visitor for this node type
-        visitor = getattr(self, "visit_" + node.__class__.__name__, None)
+        # get visitor for this node type
+        try:
+            visitor = self.visit_methods[type(node)]
+        except KeyError:
+            visitor = self.visit_methods[type(node)] = getattr(
+                self, "visit_" + node.__class__.__name__, None
+            )
 
         # if we have a visitor for it, visit it
         # it will set self.novisit if it manually visits children
@@ -73,7 +82,8 @@ class Flake8AsyncVisitor(ast.NodeVisitor, ABC):
             super().generic_visit(node)
 
         # if an outer state was saved in this node restore it after visiting children
-        self.set_state(self.outer.pop(node, {}))
+        if self.outer and (state := self.outer.pop(node, None)) is not None:
+            self.set_state(state)
 
         # set novisit so external runner doesn't visit this node with this class
         self.novisit = True
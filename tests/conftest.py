@@ -23,6 +23,15 @@ def pytest_addoption(parser: pytest.Parser):
         default="ASYNC",
         help="select error codes whose visitors to run.",
     )
+    parser.addoption(
+        "--fuzz-processes",
+        type=int,
+        default=None,
+        help=(
+            "number of processes to run the site code fuzz test in, defaults to the"
+            " number of CPUs. Use 1 to run it in the test process, e.g. for debugging."
+        ),
+    )
 
 
 def pytest_configure(config: pytest.Config):
@@ -56,3 +65,8 @@ def generate_autofix(request: pytest.FixtureRequest):
 @pytest.fixture
 def enable_codes(request: pytest.FixtureRequest):
     return request.config.getoption("--enable-codes")
+
+
+@pytest.fixture
+def fuzz_processes(request: pytest.FixtureRequest):
+    return request.config.getoption("--fuzz-processes")
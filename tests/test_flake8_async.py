@@ -3,26 +3,34 @@
 from __future__ import annotations
 
 import ast
-import copy
 import difflib
+import functools
+import hashlib
+import importlib.metadata
 import itertools
+import multiprocessing
 import os
 import re
 import site
 import sys
 import tokenize
+import traceback
 import unittest
 from argparse import ArgumentParser
-from collections import defaultdict, deque
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from dataclasses import dataclass, fields
+from operator import itemgetter
 from pathlib import Path
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, cast
 
 import libcst as cst
 import pytest
 from hypothesis import HealthCheck, given, settings
 from hypothesmith import from_grammar, from_node
 
+import flake8_async
 from flake8_async import Plugin
 from flake8_async.base import Error, Statement
 from flake8_async.visitors import ERROR_CLASSES, ERROR_CLASSES_CST
@@ -32,11 +40,14 @@ if TYPE_CHECKING:
 
     from flake8_async.visitors.flake8asyncvisitor import Flake8AsyncVisitor
 
-AUTOFIX_DIR = Path(__file__).parent / "autofix_files"
+TESTS_DIR = Path(__file__).parent
+AUTOFIX_DIR = TESTS_DIR / "autofix_files"
+EVAL_DIR = TESTS_DIR / "eval_files"
 
 
+# stems are unique, so only sort on them instead of comparing tuples
 test_files: list[tuple[str, Path]] = sorted(
-    (f.stem.upper(), f) for f in (Path(__file__).parent / "eval_files").iterdir()
+    ((f.stem.upper(), f) for f in EVAL_DIR.iterdir()), key=itemgetter(0)
 )
 autofix_files: dict[str, Path] = {
     f.stem.upper(): f for f in AUTOFIX_DIR.iterdir() if f.suffix == ".py"
@@ -48,13 +59,21 @@ assert (
 ), f"no eval file for autofix file[s] {extra_autofix_files}"
 
 
+# patterns used when parsing eval files, compiled once instead of on every line
+PY_VERSION_RE = re.compile(r"(?<=_PY)\d*")
+ARG_RE = re.compile(r"(?<=ARG ).*")
+ENABLE_RE = re.compile(r"--enable=(.*)")
+ERROR_RE = re.compile(r"(error|ASYNC...)(_.*)?:([^#]*)(?=#|$)")
+CODE_RE = re.compile(r"ASYNC\d\d\d")
+
+
 class ParseError(Exception): ...
 
 
 # check for presence of _pyXX, skip if version is later, and prune parameter
 def check_version(test: str):
-    python_version = re.search(r"(?<=_PY)\d*", test)
-    if python_version:
+    # most files don't specify a version, so avoid the regex when we can
+    if "_PY" in test and (python_version := PY_VERSION_RE.search(test)):
         version_str = python_version.group()
         major, minor = version_str[0], version_str[1:]
         v_i = sys.version_info
@@ -386,6 +405,38 @@ def test_autofix(test: str):
     assert plugin.module.code == content, "autofixed file changed when autofixed again"
 
 
+# Parse the arguments of an error annotation once per distinct string, they're then
+# evaluated with `eval_error_arg` for each line they're on.
+@functools.cache
+def parse_error_args(err_args: str) -> list[ast.expr]:
+    tree = ast.parse(f"[{err_args}]", mode="eval")
+    assert isinstance(tree.body, ast.List)
+    return tree.body.elts
+
+
+# Evaluate the limited subset of expressions used in error annotations:
+# literals, `lineno`/`line` with +/- offsets, and `Statement`/`Stmt` calls.
+def eval_error_arg(node: ast.expr, lineno: int) -> Any:
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.Name) and node.id in ("lineno", "line"):
+        return lineno
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        return -eval_error_arg(node.operand, lineno)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        return eval_error_arg(node.left, lineno) + eval_error_arg(node.right, lineno)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Sub):
+        return eval_error_arg(node.left, lineno) - eval_error_arg(node.right, lineno)
+    if (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Name)
+        and node.func.id in ("Statement", "Stmt")
+        and not node.keywords
+    ):
+        return Statement(*(eval_error_arg(arg, lineno) for arg in node.args))
+    raise ParseError(f"unsupported expression in error annotation: {ast.unparse(node)}")
+
+
 def _parse_eval_file(
     test: str, content: str, only_check_not_crash: bool = False
 ) -> tuple[list[Error], list[str], str]:
@@ -405,42 +456,43 @@ def _parse_eval_file(
 
     expected: list[Error] = []
 
+    # not using `splitlines()`, since that also splits on form feeds and other
+    # characters that `ast` & `libcst` don't see as newlines, messing up line numbers.
     for lineno, line in enumerate(content.split("\n"), start=1):
+        # Most lines have neither an #ARG nor an error annotation, and the substring
+        # checks are much cheaper than any other processing of the line.
+        has_arg = "ARG " in line
+        has_error = "error" in line or "ASYNC" in line
+        if not has_arg and not has_error:
+            continue
+
         # interpret '\n' in comments as actual newlines
         line = line.replace("\\n", "\n")
 
         line = line.strip()
 
         # add command-line args if specified with #ARG
-        if reg_match := re.search(r"(?<=ARG ).*", line):
+        if has_arg and (reg_match := ARG_RE.search(line)):
             argument = reg_match.group().strip()
             parsed_args.append(argument)
-            if m := re.match(r"--enable=(.*)", argument):
+            if m := ENABLE_RE.match(argument):
                 enabled_codes = m.groups()[0]
 
         # skip commented out lines
         if not line or line[0] == "#":
             continue
 
+        if not has_error:
+            continue
+
         # get text between `error:` and (end of line or another comment)
-        k = re.findall(r"(error|ASYNC...)(_.*)?:([^#]*)(?=#|$)", line)
+        k = ERROR_RE.findall(line)
 
         for err_code, alt_code, err_args in k:
             try:
-                try:
-                    args = eval(
-                        f"[{err_args}]",
-                        {
-                            "lineno": lineno,
-                            "line": lineno,
-                            "Statement": Statement,
-                            "Stmt": Statement,
-                        },
-                    )
-                except NameError:
-                    print(f"failed to eval on line {lineno}", file=sys.stderr)
-                    raise
-
+                args = [
+                    eval_error_arg(arg, lineno) for arg in parse_error_args(err_args)
+                ]
             except Exception as e:
                 print(f"lineno: {lineno}, line: {line}", file=sys.stderr)
                 raise e
@@ -468,18 +520,17 @@ def _parse_eval_file(
     assert enabled_codes, "no codes enabled. Fix file name or add `# ARG --enable=...`"
     enabled_codes_list = enabled_codes.split(",")
     for code in enabled_codes_list:
-        assert re.fullmatch(
-            r"ASYNC\d\d\d", code
+        assert CODE_RE.fullmatch(
+            code
         ), f"invalid code {code} in list {enabled_codes_list}"
 
+    # codes are validated to be exactly `ASYNCxxx` above, as are error codes, so
+    # checking membership is enough
+    enabled_codes_set = frozenset(enabled_codes_list)
     for error in expected:
-        for code in enabled_codes.split(","):
-            if error.code.startswith(code):
-                break
-        else:
-            assert (
-                error.code in enabled_codes_list
-            ), f"Expected error code {error.code} not enabled"
+        assert (
+            error.code in enabled_codes_set
+        ), f"Expected error code {error.code} not enabled"
 
     return expected, parsed_args, enabled_codes
 
@@ -569,7 +620,7 @@ def assert_expected_errors(
     # initialize default option values
     initialize_options(plugin, args)
 
-    errors = sorted(e for e in plugin.run())
+    errors = sorted(plugin.run())
     expected_ = sorted(expected)
 
     if ignore_column:
@@ -588,12 +639,15 @@ def assert_expected_errors(
         )
         return errors
 
-    print_first_diff(errors, expected_)
-    assert_correct_lines_and_codes(errors, expected_)
-    if not ignore_column:
-        assert_correct_attribute(errors, expected_, "col")
-    assert_correct_attribute(errors, expected_, "message")
-    assert_correct_attribute(errors, expected_, "args")
+    # the detailed checks only exist to print helpful output on failure, so skip them
+    # if there's nothing to report
+    if errors != expected_:
+        print_first_diff(errors, expected_)
+        assert_correct_lines_and_codes(errors, expected_)
+        if not ignore_column:
+            assert_correct_attribute(errors, expected_, "col")
+        assert_correct_attribute(errors, expected_, "message")
+        assert_correct_attribute(errors, expected_, "args")
 
     # full check
     assert errors == expected_
@@ -628,46 +682,43 @@ def print_first_diff(errors: Sequence[Error], expected: Sequence[Error]):
 
 def assert_correct_lines_and_codes(errors: Iterable[Error], expected: Iterable[Error]):
     """Check that errors are on correct lines."""
-    all_lines = sorted({e.line for e in (*errors, *expected)})
-
-    error_dict: defaultdict[int, defaultdict[str, int]] = defaultdict(
-        lambda: defaultdict(int)
-    )
-    expected_dict = copy.deepcopy(error_dict)
+    # number of errors per (line, code)
+    error_counts = Counter((e.line, e.code) for e in errors)
+    expected_counts = Counter((e.line, e.code) for e in expected)
 
-    # populate dicts with number of errors per line
-    for e in errors:
-        error_dict[e.line][e.code] += 1
-    for e in expected:
-        expected_dict[e.line][e.code] += 1
+    all_keys = sorted(error_counts.keys() | expected_counts.keys())
+    wrong_lines = {
+        line
+        for line, code in all_keys
+        if error_counts[line, code] != expected_counts[line, code]
+    }
 
     error_count = 0
     printed_header = False
-    for line in all_lines:
-        if error_dict[line] == expected_dict[line]:
+    # go through all the codes on lines that differ
+    for line, code in all_keys:
+        if line not in wrong_lines:
             continue
 
-        # go through all the codes on the line
-        for code in sorted({*error_dict[line], *expected_dict[line]}):
-            if not printed_header:
-                print(
-                    "Lines with different # of errors:",
-                    "-" * 38,
-                    f"| line | {'code':8} | actual | expected |",
-                    sep="\n",
-                    file=sys.stderr,
-                )
-                printed_header = True
-
+        if not printed_header:
             print(
-                f"| {line:4}",
-                f"{code}",
-                f"{error_dict[line][code]:6}",
-                f"{expected_dict[line][code]:8} |",
-                sep=" | ",
+                "Lines with different # of errors:",
+                "-" * 38,
+                f"| line | {'code':8} | actual | expected |",
+                sep="\n",
                 file=sys.stderr,
             )
-            error_count += abs(error_dict[line][code] - expected_dict[line][code])
+            printed_header = True
+
+        print(
+            f"| {line:4}",
+            f"{code}",
+            f"{error_counts[line, code]:6}",
+            f"{expected_counts[line, code]:8} |",
+            sep=" | ",
+            file=sys.stderr,
+        )
+        error_count += abs(error_counts[line, code] - expected_counts[line, code])
     assert error_count == 0
 
 
@@ -844,13 +895,22 @@ def consume(iterator: Iterable[Any]):
     deque(iterator, maxlen=0)
 
 
+# generated sources the plugin has already run on without crashing, so that
+# hypothesis replaying or shrinking towards a known example doesn't redo the work
+_fuzz_checked_sources: set[str] = set()
+
+
 @pytest.mark.fuzz
 class TestFuzz(unittest.TestCase):
     @settings(
         max_examples=1_000, deadline=None, suppress_health_check=[HealthCheck.too_slow]
     )
-    @given((from_grammar() | from_node()).map(ast.parse))
-    def test_does_not_crash_on_any_valid_code(self, syntax_tree: ast.AST):
+    @given(from_grammar() | from_node())
+    def test_does_not_crash_on_any_valid_code(self, source: str):
+        if source in _fuzz_checked_sources:
+            return
+        syntax_tree = ast.parse(source)
+
         # TODO: figure out how to get unittest to play along with pytest options
         # so `--enable-codes` can be passed through.
         # Though I barely notice a difference manually changing this value, or even
@@ -864,25 +924,142 @@ class TestFuzz(unittest.TestCase):
         initialize_options(plugin, [f"--enable={enabled_codes}"])
 
         consume(plugin.run())
+        _fuzz_checked_sources.add(source)
 
 
-def _iter_python_files():
+def _iter_python_files() -> Iterable[str]:
     # Because the generator isn't perfect, we'll also test on all the code
     # we can easily find in our current Python environment - this includes
     # the standard library, and all installed packages.
-    for base in sorted(set(site.PREFIXES)):
-        for dirname, _, files in os.walk(base):
-            for f in files:
-                if f.endswith(".py"):
-                    yield Path(dirname) / f
+    # Walks the directories with a stack of `os.scandir` calls, which unlike `os.walk`
+    # doesn't build lists of directories and files for each directory.
+    stack = sorted(set(site.PREFIXES), reverse=True)
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.endswith(".py") and entry.is_file():
+                        yield entry.path
+        except OSError:  # noqa: PERF203 # try-except in loop
+            # skip unreadable directories, same as `os.walk` does
+            continue
 
 
-@pytest.mark.fuzz
-def test_does_not_crash_on_site_code(enable_codes: str):
-    for path in _iter_python_files():
+# only walk the site directories once per test session
+@pytest.fixture(scope="session")
+def site_python_files() -> list[str]:
+    return list(_iter_python_files())
+
+
+# Files that have already been checked are remembered in the pytest cache, keyed on
+# their mtime & size, so rerunning the test only checks files that have changed.
+# The cache is invalidated whenever the plugin source, this test file, the python,
+# libcst or flake8 version, or the enabled codes change.
+SITE_CODE_CACHE_KEY = "flake8_async/site_code_checked"
+
+
+def _site_code_cache_digest(enable_codes: str) -> str:
+    digest = hashlib.sha256(
+        "\n".join(
+            (
+                sys.version,
+                importlib.metadata.version("libcst"),
+                importlib.metadata.version("flake8"),
+                enable_codes,
+            )
+        ).encode()
+    )
+    digest.update(Path(__file__).read_bytes())
+    for source_file in sorted(Path(flake8_async.__file__).parent.rglob("*.py")):
+        digest.update(source_file.read_bytes())
+    return digest.hexdigest()
+
+
+def _check_site_file(path: str, enable_codes: str) -> None:
+    plugin = Plugin.from_filename(path)
+    initialize_options(plugin, [f"--enable={enable_codes}"])
+    consume(plugin.run())
+
+
+# run in worker processes, so failures are returned as (path, traceback) pairs
+# instead of raising, since tracebacks don't survive pickling.
+def _check_site_files(paths: list[str], enable_codes: str) -> list[tuple[str, str]]:
+    failures: list[tuple[str, str]] = []
+    for path in paths:
         try:
-            plugin = Plugin.from_filename(str(path))
-            initialize_options(plugin, [f"--enable={enable_codes}"])
-            consume(plugin.run())
-        except Exception as err:  # noqa: PERF203 # try-except in loop
-            raise AssertionError(f"Failed on {path}") from err
+            _check_site_file(path, enable_codes)
+        except Exception:  # noqa: PERF203 # try-except in loop
+            failures.append((path, traceback.format_exc()))
+    return failures
+
+
+SITE_CODE_BATCH_SIZE = 100
+
+
+@pytest.mark.fuzz
+def test_does_not_crash_on_site_code(
+    site_python_files: list[str],
+    enable_codes: str,
+    fuzz_processes: int | None,
+    cache: pytest.Cache,
+):
+    digest = _site_code_cache_digest(enable_codes)
+    # pytest doesn't annotate the type of `default`
+    cached = cast("dict[str, Any]", cache.get(SITE_CODE_CACHE_KEY, {}))  # type: ignore
+    checked: dict[str, list[int]] = {}
+    if cached.get("digest") == digest:
+        checked = cached["checked"]
+
+    unchecked: dict[str, list[int]] = {}
+    for path in site_python_files:
+        stat = Path(path).stat()
+        fingerprint = [stat.st_mtime_ns, stat.st_size]
+        if checked.get(path) != fingerprint:
+            unchecked[path] = fingerprint
+
+    try:
+        if fuzz_processes == 1:
+            for path, fingerprint in unchecked.items():
+                try:
+                    _check_site_file(path, enable_codes)
+                except Exception as err:
+                    raise AssertionError(f"Failed on {path}") from err
+                checked[path] = fingerprint
+            return
+
+        paths = list(unchecked)
+        batches = [
+            paths[i : i + SITE_CODE_BATCH_SIZE]
+            for i in range(0, len(paths), SITE_CODE_BATCH_SIZE)
+        ]
+        # use spawn, as forking a (possibly multi-threaded, e.g. with xdist)
+        # pytest process is unsafe.
+        with ProcessPoolExecutor(
+            max_workers=fuzz_processes, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            futures = {
+                executor.submit(_check_site_files, batch, enable_codes): batch
+                for batch in batches
+            }
+            for future in as_completed(futures):
+                try:
+                    failures = future.result()
+                except BrokenProcessPool as err:
+                    # a worker died (e.g. segfault or OOM), so the failing file is
+                    # somewhere in its batch
+                    raise AssertionError(
+                        "worker crashed while checking batch starting at"
+                        f" {futures[future][0]}, rerun with --fuzz-processes=1 to"
+                        " find the exact file"
+                    ) from err
+                if failures:
+                    executor.shutdown(cancel_futures=True)
+                    path, formatted_traceback = failures[0]
+                    raise AssertionError(f"Failed on {path}\n{formatted_traceback}")
+                for path in futures[future]:
+                    checked[path] = unchecked[path]
+    finally:
+        # save progress even on failure, so a rerun picks up where this one failed
+        cache.set(SITE_CODE_CACHE_KEY, {"digest": digest, "checked": checked})